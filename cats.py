@@ -1,10 +1,13 @@
 """Typing test implementation"""
+import heapq
 import math
-import operator
+import string
+from functools import lru_cache
+from itertools import islice
+from time import perf_counter
 
 from utils import lower, split, remove_punctuation, lines_from_file
 from ucb import main, interact, trace
-from datetime import datetime
 
 
 ###########
@@ -33,7 +36,7 @@ def pick(paragraphs, select, k):
     """
     empty_paragraph = ""
     for paragraph in paragraphs:
-        if select(paragraph) is True:
+        if select(paragraph):
             if k == 0:
                 return paragraph
             else:
@@ -54,23 +57,29 @@ def about(topic):
     >>> pick(['Cute Dog!', 'That is a cat.', 'Nice pup.'], about_dogs, 1)
     'Nice pup.'
     """
+    return about_words_of(topic, apply_changes_on)
+
+
+def about_words_of(topic, words_of):
+    """Return a select function that returns whether WORDS_OF called on its
+    argument, a set of normalized words, contains one of the words in TOPIC.
+    """
     assert all([lower(x) == x for x in topic]), 'topics should be lowercase.'
 
-    def select(paragraph):
-        paragraph = apply_changes_on(paragraph)
-        for word in topic:
-            if lower(word) in paragraph:
-                return True
-        return False
+    topic_words = frozenset(topic)
+
+    def select(item):
+        return not topic_words.isdisjoint(words_of(item))
 
     return select
 
 
+PUNCTUATION_REMOVER = str.maketrans('', '', string.punctuation)
+
+
+@lru_cache(maxsize=4096)
 def apply_changes_on(paragraph):
-    paragraph = lower(paragraph)
-    paragraph = remove_punctuation(paragraph)
-    paragraph = split(paragraph)
-    return paragraph
+    return frozenset(paragraph.lower().translate(PUNCTUATION_REMOVER).split())
 
 
 def accuracy(typed, source):
@@ -113,17 +122,12 @@ def accuracy(typed, source):
 
 
 def compute_mistyped_words(typed_words, source_words):
-    miss_typed_words_cnt = 0
-    for i in range(min(len(typed_words), len(source_words))):
-        if typed_words[i] != source_words[i]:
-            miss_typed_words_cnt += 1
-
-    return miss_typed_words_cnt
+    return sum(1 for typed_word, source_word in zip(typed_words, source_words) if typed_word != source_word)
 
 
 def compute_extra_typed_words(typed_words_len, source_words_len):
     if typed_words_len > source_words_len:
-        return operator.sub(typed_words_len, source_words_len)
+        return typed_words_len - source_words_len
     return 0
 
 
@@ -172,12 +176,19 @@ def autocorrect(typed_word, word_list, diff_function, limit):
     """
     if typed_word in word_list:
         return typed_word
-    autocorrect_word, smallest_diff = compute_smallest_diff_and_return_word(diff_function, limit, typed_word, word_list)
+    if is_edit_distance(diff_function):
+        # The second call on a word list builds and keeps a trie for it, which
+        # can cost seconds and over 100 MB; see compute_smallest_edit_distance.
+        autocorrect_word, smallest_diff = compute_smallest_edit_distance(diff_function, limit, typed_word, word_list)
+    else:
+        autocorrect_word, smallest_diff = compute_smallest_diff_and_return_word(diff_function, limit, typed_word, word_list)
 
     return typed_word if smallest_diff > limit else autocorrect_word
 
 
 def compute_smallest_diff_and_return_word(diff_function, limit, typed_word, word_list):
+    if is_length_bounded(diff_function):
+        return compute_smallest_diff_by_length(diff_function, limit, typed_word, word_list)
     smallest_diff, autocorrect_word = math.inf, ""
     for word in word_list:
         current_diff = diff_function(typed_word, word, limit)
@@ -187,6 +198,190 @@ def compute_smallest_diff_and_return_word(diff_function, limit, typed_word, word
     return autocorrect_word, smallest_diff
 
 
+def compute_smallest_diff_by_length(diff_function, limit, typed_word, word_list):
+    """Like compute_smallest_diff_and_return_word, but visits the words closest
+    in length to TYPED_WORD first and stops once the length difference alone
+    rules out beating the smallest diff found so far."""
+    smallest_diff, autocorrect_word, autocorrect_index = math.inf, "", math.inf
+    # tuple() hands back a tuple WORD_LIST as is, so callers that already
+    # built one pay for no second copy.
+    words_of_length = words_by_length(tuple(word_list))
+    longest = max(words_of_length, default=0)
+    typed_len = len(typed_word)
+    length_diff = 0
+    while length_diff <= min(limit, smallest_diff) and length_diff <= max(typed_len, longest):
+        for length in {typed_len - length_diff, typed_len + length_diff}:
+            for index, word in words_of_length.get(length, ()):
+                # Words after the current best only replace it with a strictly
+                # smaller diff, which these words' length rules out.
+                if index > autocorrect_index and length_diff >= smallest_diff:
+                    break
+                current_limit = smallest_diff if index < autocorrect_index else smallest_diff - 1
+                current_diff = diff_function(typed_word, word, min(limit, current_limit))
+                if current_diff < smallest_diff or (current_diff == smallest_diff and index < autocorrect_index):
+                    smallest_diff = current_diff
+                    autocorrect_word, autocorrect_index = word, index
+                if smallest_diff == 0:
+                    return autocorrect_word, smallest_diff
+        length_diff += 1
+    return autocorrect_word, smallest_diff
+
+
+@lru_cache(maxsize=8)
+def words_by_length(words):
+    """Return a dictionary mapping each length to the (index, word) pairs of
+    the tuple WORDS with that length, in their original order."""
+    words_of_length = {}
+    for index, word in enumerate(words):
+        words_of_length.setdefault(len(word), []).append((index, word))
+    return words_of_length
+
+
+def is_length_bounded(diff_function):
+    """Whether DIFF_FUNCTION never returns less than the length difference of
+    its two words, so that difference can be used to skip candidates."""
+    return diff_function in (feline_fixes, minimum_mewtations, final_diff)
+
+
+def is_edit_distance(diff_function):
+    """Whether DIFF_FUNCTION is the edit distance whenever that distance is
+    within its limit, so candidates can be looked up in a word trie."""
+    return diff_function in (minimum_mewtations, final_diff)
+
+
+def compute_smallest_edit_distance(diff_function, limit, typed_word, word_list):
+    """Like compute_smallest_diff_and_return_word for an edit-distance
+    DIFF_FUNCTION, but searches a word trie once WORD_LIST is corrected against
+    a second time.
+
+    The trie is built inside the autocorrect call that first needs it, and
+    the most recent one stays cached for the life of the process. For the
+    220k words of data/words.txt that call takes an extra 1-3 seconds, and
+    the trie holds about 150 MB. Alternating between several large lists
+    rebuilds the trie on every switch.
+    """
+    words = tuple(word_list)
+    if is_repeated_word_list(words):
+        return search_word_trie(word_trie(words), typed_word, limit)
+    return compute_smallest_diff_by_length(diff_function, limit, typed_word, words)
+
+
+# Hashes of the word lists autocorrect has seen, so a word trie is only built for
+# a list once it is corrected against a second time.
+SEEN_WORD_LISTS = set()
+
+
+def is_repeated_word_list(words):
+    """Whether the tuple WORDS was passed to this function before. Building a
+    word trie costs more than one linear scan, so one-off word lists, like
+    the GUI's per-word candidates, never pay for it."""
+    key = hash(words)
+    if key in SEEN_WORD_LISTS:
+        return True
+    if len(SEEN_WORD_LISTS) >= 1024:
+        SEEN_WORD_LISTS.clear()
+    SEEN_WORD_LISTS.add(key)
+    return False
+
+
+class TrieNode:
+    """A node of a word trie. CHILDREN maps each next character to a child
+    node, or is None for a leaf. Nodes that end a word hold that word and the
+    index of its first occurrence in the word list. MIN_LENGTH and MAX_LENGTH
+    are the shortest and longest words in the node's subtree."""
+    __slots__ = ("children", "index", "word", "min_length", "max_length")
+
+    def __init__(self):
+        self.children, self.index, self.word = None, None, None
+        self.min_length, self.max_length = math.inf, -math.inf
+
+
+@lru_cache(maxsize=1)
+def word_trie(words):
+    """Return the root TrieNode of a prefix trie holding the tuple of WORDS.
+    Only the most recent trie is cached, as one for data/words.txt takes over
+    100 MB."""
+    root = TrieNode()
+    for index, word in enumerate(words):
+        node = root
+        length = len(word)
+        for char in word:
+            node.min_length, node.max_length = min(node.min_length, length), max(node.max_length, length)
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+        node.min_length, node.max_length = min(node.min_length, length), max(node.max_length, length)
+        if node.index is None:
+            node.index, node.word = index, word
+    return root
+
+
+def search_word_trie(root, typed_word, limit):
+    """Return the word in the trie at ROOT with the smallest edit distance to
+    TYPED_WORD, along with that distance. Ties go to the word that came first
+    in the original word list, and only words within LIMIT are found.
+
+    Every node extends its parent's row of the edit-distance table by one
+    character, so words sharing a prefix share that work. Any word below a
+    node aligns some prefix of TYPED_WORD with the node's prefix, costing that
+    entry of its row, and the rest of TYPED_WORD with the rest of the word,
+    costing at least their difference in length. The smallest such total over
+    the row bounds every word in the subtree, so nodes are visited in order of
+    that bound, and the search stops once it exceeds the best distance found
+    so far.
+    """
+    smallest_diff, autocorrect_word, autocorrect_index = math.inf, "", math.inf
+    if limit < 0:
+        return autocorrect_word, smallest_diff
+    radius = limit
+    n = len(typed_word)
+    # Entries are (bound, push order, node, row); the push order breaks ties
+    # in the bound so nodes are never compared.
+    pushed = 0
+    frontier = [(0, pushed, root, list(range(n + 1)))]
+
+    while frontier:
+        bound, _, node, row = heapq.heappop(frontier)
+        if bound > radius:
+            break
+        distance, index = row[n], node.index
+        if index is not None and distance <= radius:
+            if distance < smallest_diff or index < autocorrect_index:
+                smallest_diff = distance
+                autocorrect_word, autocorrect_index = node.word, index
+            radius = distance
+        if node.children is None:
+            continue
+        for char, child in node.children.items():
+            depth = row[0] + 1
+            # The range of lengths left to spell below CHILD.
+            shortest, longest = child.min_length - depth, child.max_length - depth
+            child_row = [depth]
+            child_bound = depth + max(0, shortest - n, n - longest)
+            for j in range(1, n + 1):
+                cost = row[j - 1] if typed_word[j - 1] == char else row[j - 1] + 1
+                if row[j] + 1 < cost:
+                    cost = row[j] + 1
+                if child_row[j - 1] + 1 < cost:
+                    cost = child_row[j - 1] + 1
+                child_row.append(cost)
+                rest = n - j
+                if shortest > rest:
+                    cost += shortest - rest
+                elif rest > longest:
+                    cost += rest - longest
+                if cost < child_bound:
+                    child_bound = cost
+            if child_bound <= radius:
+                pushed += 1
+                heapq.heappush(frontier, (child_bound, pushed, child, child_row))
+
+    return autocorrect_word, smallest_diff
+
+
 def feline_fixes(typed, source, limit):
     """A diff function for autocorrect that determines how many letters
     in TYPED need to be substituted to create SOURCE, then adds the difference in
@@ -212,13 +407,10 @@ def feline_fixes(typed, source, limit):
     if limit < 0:
         return 0
 
-    if len(typed) == 0 or len(source) == 0:
-        return len(source) + len(typed)
-
-    if typed[0] == source[0]:
-        return feline_fixes(typed[1:], source[1:], limit)
-
-    return 1 + feline_fixes(typed[1:], source[1:], limit - 1)
+    # Stop counting once the limit is exceeded; the result is capped anyway.
+    mismatches = (1 for typed_char, source_char in zip(typed, source) if typed_char != source_char)
+    substitutions = sum(islice(mismatches, int(min(limit, len(typed))) + 1))
+    return min(substitutions + abs(len(typed) - len(source)), limit + 1)
 
 
 def minimum_mewtations(start, goal, limit):
@@ -238,17 +430,113 @@ def minimum_mewtations(start, goal, limit):
     """
     if limit < 0:
         return 0
-    elif len(goal) == 0 or len(start) == 0:
-        return len(goal) + len(start)
-    else:
-        if goal[0] == start[0]:
-            return minimum_mewtations(start[1:], goal[1:], limit)
 
-        add = minimum_mewtations(start, goal[1:], limit - 1)
-        remove = minimum_mewtations(start[1:], goal, limit - 1)
-        substitute = minimum_mewtations(start[1:], goal[1:], limit - 1)
+    m, n = len(start), len(goal)
+    if abs(m - n) > limit:
+        return limit + 1
+
+    band = int(min(limit, max(m, n)))
+    distance = cached_mewtations_kernel(start, goal, band)
+    return distance if distance <= limit else limit + 1
+
+
+def mewtations_kernel(start, goal, band):
+    """Return the edit distance from START to GOAL if it is at most BAND, and
+    some number greater than BAND otherwise.
+
+    Only cells within BAND of the diagonal of the edit-distance table can
+    stay within BAND; cells outside of it are treated as BAND + 1. Unless the
+    band is very narrow, words that fit in MYERS_MAX_LENGTH bits are measured
+    exactly with myers_distance instead.
+    """
+    m, n = len(start), len(goal)
+    if band > 1 and 0 < m <= MYERS_MAX_LENGTH:
+        return myers_distance(start, goal)
+    over_limit = band + 1
+    prev = [j if j <= band else over_limit for j in range(n + 1)]
+    curr = [over_limit] * (n + 1)
+
+    for i in range(1, m + 1):
+        start_char = start[i - 1]
+        lo, hi = max(1, i - band), min(n, i + band)
+        curr[0] = i if i <= band else over_limit
+        if lo > 1:
+            curr[lo - 1] = over_limit
+        if hi < n:
+            curr[hi + 1] = over_limit
+        left = row_min = curr[lo - 1]
+        for j in range(lo, hi + 1):
+            substitute = prev[j - 1]
+            if start_char == goal[j - 1]:
+                left = substitute
+            else:
+                remove = prev[j]
+                if remove < substitute:
+                    substitute = remove
+                if left < substitute:
+                    substitute = left
+                left = substitute + 1
+            curr[j] = left
+            if left < row_min:
+                row_min = left
+        if row_min > band:
+            return over_limit
+        prev, curr = curr, prev
+
+    return prev[n]
+
+
+MYERS_MAX_LENGTH = 64
+
 
-        return 1 + min(add, remove, substitute)
+def myers_distance(pattern, text):
+    """Return the edit distance from PATTERN to TEXT using Myers' bit-parallel
+    algorithm.
+
+    Bit i of each vector describes row i + 1 of the current column of the
+    edit-distance table: PV and MV mark where the value goes up or down by one
+    from the row above, and PEQ[c] marks the rows whose PATTERN character is c.
+    Each character of TEXT advances the whole column with a few integer
+    operations, tracking the distance in the last row.
+
+    >>> myers_distance("ckiteus", "kittens")
+    3
+    >>> myers_distance("", "cat")
+    3
+    """
+    m = len(pattern)
+    if m == 0:
+        return len(text)
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last_row = 1 << (m - 1)
+    pv, mv, distance = mask, 0, m
+
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last_row:
+            distance += 1
+        elif mh & last_row:
+            distance -= 1
+        # The top row of the table grows by one per column.
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return distance
+
+
+# Direct minimum_mewtations and final_diff calls, such as autocorrect's first
+# linear scan of a word list or the GUI's per-word candidates, often repeat
+# the same pairs of words, so remember recent kernel results.
+cached_mewtations_kernel = lru_cache(maxsize=16384)(mewtations_kernel)
 
 
 def final_diff(typed, source, limit):
@@ -304,13 +592,8 @@ def get_progress_ratio(correctly_typed_till_mistype, prompt):
 
 
 def compute_correct_words_till_mistype(prompt, typed):
-    typed_correctly_till_mistype = 0
-    for i in range(len(typed)):
-        if typed[i] == prompt[i]:
-            typed_correctly_till_mistype += 1
-        else:
-            break
-    return typed_correctly_till_mistype
+    mistypes = (i for i, (typed_word, prompt_word) in enumerate(zip(typed, prompt)) if typed_word != prompt_word)
+    return next(mistypes, min(len(typed), len(prompt)))
 
 
 def time_per_word(words, times_per_player):
@@ -330,19 +613,12 @@ def time_per_word(words, times_per_player):
     >>> match["times"]
     [[6, 3, 6, 2], [10, 6, 1, 2]]
     """
-    p = times_per_player
-    times = []
-    for i in range(len(p)):
-        times += [get_time_per_player(p[i])]
-
+    times = [get_time_per_player(player_times) for player_times in times_per_player]
     return match(words, times)
 
 
 def get_time_per_player(times):
-    player_time = []
-    for i in range(len(times)-1):
-        player_time.append(times[i+1] - times[i])
-    return player_time
+    return [later - earlier for earlier, later in zip(times, times[1:])]
 
 
 def fastest_words(match):
@@ -365,21 +641,13 @@ def fastest_words(match):
     fastest_words_per_player = [[] for _ in range(player_count)]
 
     for word_index in range(word_count):
-        compute_fastest_words_for_each_player(fastest_words_per_player, match, player_count, word_index)
+        player = compute_fastest_player(match, player_count, word_index)
+        fastest_words_per_player[player].append(get_word(match, word_index))
     return fastest_words_per_player
 
 
-def compute_fastest_words_for_each_player(fastest_words_per_player, match, player_count, word_index):
-    min_time_per_word_for_player = math.inf
-    player = 0
-    word = ""
-    for player_index in range(player_count):
-        current_word_time = time(match, player_index, word_index)
-        if current_word_time < min_time_per_word_for_player:
-            min_time_per_word_for_player = current_word_time
-            player = player_index
-            word = get_word(match, word_index)
-    fastest_words_per_player[player].append(word)
+def compute_fastest_player(match, player_count, word_index):
+    return min(range(player_count), key=lambda player_index: time(match, player_index, word_index))
 
 
 def match(words, times):
@@ -438,15 +706,34 @@ enable_multiplayer = False  # Change to True when you're ready to race.
 ##########################
 
 
+PARAGRAPHS_PATH = 'data/sample_paragraphs.txt'
+
+
+@lru_cache(maxsize=None)
+def load_paragraphs(path=PARAGRAPHS_PATH):
+    """Return a tuple of the paragraphs in the file at PATH, reading the file
+    only once per path."""
+    return tuple(lines_from_file(path))
+
+
+@lru_cache(maxsize=None)
+def paragraph_word_sets(path=PARAGRAPHS_PATH):
+    """Return a tuple holding the normalized set of words in each paragraph of
+    load_paragraphs(PATH), at the same index as the paragraph itself."""
+    return tuple(apply_changes_on(paragraph) for paragraph in load_paragraphs(path))
+
+
 def run_typing_test(topics):
     """Measure typing speed and accuracy on the command line."""
-    paragraphs = lines_from_file('data/sample_paragraphs.txt')
-    select = lambda p: True
+    paragraphs = load_paragraphs()
+    select = lambda index: True
     if topics:
-        select = about(topics)
+        word_sets = paragraph_word_sets()
+        select = about_words_of(topics, lambda index: word_sets[index])
+    sources = [paragraphs[index] for index in range(len(paragraphs)) if select(index)]
     i = 0
     while True:
-        source = pick(paragraphs, select, i)
+        source = sources[i] if i < len(sources) else ''
         if not source:
             print('No more paragraphs about', topics, 'are available.')
             return
@@ -455,14 +742,14 @@ def run_typing_test(topics):
         print(source)
         print()
 
-        start = datetime.now()
+        start = perf_counter()
         typed = input()
         if not typed:
             print('Goodbye.')
             return
         print()
 
-        elapsed = (datetime.now() - start).total_seconds()
+        elapsed = perf_counter() - start
         print("Nice work!")
         print('Words per minute:', wpm(typed, elapsed))
         print('Accuracy:        ', accuracy(typed, source))
@@ -21,7 +21,7 @@ SIMILARITY_LIMIT = 2
 @route
 def request_paragraph(topics=None):
     """Return a random paragraph."""
-    paragraphs = cats.lines_from_file(PARAGRAPH_PATH)
+    paragraphs = list(cats.load_paragraphs(PARAGRAPH_PATH))
     random.shuffle(paragraphs)
     select = cats.about(topics) if topics else lambda x: True
     return cats.pick(paragraphs, select, 0)